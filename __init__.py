@@ -1,6 +1,16 @@
 """
 Abstract report generation package
 """
+from . import definitions as _definitions
 from .definitions import *
-from . import html_engine
-from .html_engine import save_report
+
+# star-import also provides the HTML engine, importing it through __getattr__ below
+__all__ = [name for name in dir(_definitions) if not name.startswith('_')] + ['html_engine', 'save_report']
+
+
+def __getattr__(name):
+    # the HTML engine pulls in pandas and bokeh: import it on first use
+    if name in ('html_engine', 'save_report'):
+        from . import html_engine
+        return html_engine if name == 'html_engine' else html_engine.save_report
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,15 +1,38 @@
 import dataclasses
+import enum
+import importlib
+import itertools
+import weakref
+from collections import deque
 from abc import abstractmethod
-from typing import Sequence, Tuple, List
+from typing import ClassVar, Sequence, Tuple, List, TYPE_CHECKING
 
-import pandas
+if TYPE_CHECKING:
+    import pandas
+
+
+def _value_key(value):
+    """
+    Hashable key of an attribute value: scalars by value, sequences element-wise, other objects by identity
+    """
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    if isinstance(value, (tuple, list)):
+        return tuple(_value_key(v) for v in value)
+    return id(value)
+
+
+# source of Content._tag_ values
+_content_tags = itertools.count(1)
 
 
 class Engine:
     """
     Base engine definition
     """
+    __slots__ = ()
     _engines_ = {}
+    _instances_ = {}
 
     @abstractmethod
     def render(self, report):
@@ -17,48 +40,98 @@ class Engine:
 
     @staticmethod
     def get_engine(name: str) -> 'Engine':
-        return Engine._engines_[name]()
+        """
+        Return shared engine instance registered under the specified name
+        """
+        engine = Engine._instances_.get(name)
+        if engine is None:
+            if name not in Engine._engines_:
+                # engines register themselves when their module (e.g. html_engine) is imported
+                importlib.import_module(f'{__package__}.{name}_engine')
+            engine = Engine._instances_[name] = Engine._engines_[name]()
+        return engine
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class Content:
     """
     Base class for abstract content item.
+    Every subclass gets a unique integer _tag_ that engines can use to index dispatch tables.
     """
-    pass
+    _tag_: ClassVar[int] = 0
 
+    def __init_subclass__(cls, **kwargs):
+        super(Content, cls).__init_subclass__(**kwargs)
+        cls._tag_ = next(_content_tags)
 
-@dataclasses.dataclass
+    def cache_key(self):
+        """
+        Hashable key of the item: engines may reuse rendered output between items with equal keys
+        """
+        return type(self), id(self)
+
+
+@dataclasses.dataclass(slots=True)
 class Box(Content):
     """
     Content group. Can group content vertically / horizontally.
     """
-    content: List[Content] = None
+    content: Tuple[Content, ...] = None
     orientation: str = "vertical"
     spacing: int = 0
 
     def __init__(self, *content, orientation: str = "vertical", spacing=0):
-        super().__init__()
-        self.content = list(content)
+        self.content = content
         self.orientation = orientation
         self.spacing = spacing
 
+    def add(self, *content: Content):
+        """
+        Append content items to the group
+        """
+        self.content += content
 
-@dataclasses.dataclass
+
+class VBox(Box):
+    """
+    Vertical content group
+    """
+    __slots__ = ()
+
+    def __init__(self, *content, spacing=0):
+        super().__init__(*content, orientation='vertical', spacing=spacing)
+
+
+class HBox(Box):
+    """
+    Horizontal content group
+    """
+    __slots__ = ()
+
+    def __init__(self, *content, spacing=0):
+        super().__init__(*content, orientation='horizontal', spacing=spacing)
+
+
+@dataclasses.dataclass(slots=True)
 class Grid(Content):
     """
     Displays a grid
     """
-    content: Sequence[Content] = None
+    content: Tuple[Content, ...] = None
     columns: int = 1
 
     def __init__(self, *content, columns=1):
-        super().__init__()
         self.columns = columns
-        self.content = list(content)
+        self.content = content
 
+    def add(self, *content: Content):
+        """
+        Append content items to the grid
+        """
+        self.content += content
 
-@dataclasses.dataclass
+
+@dataclasses.dataclass(slots=True)
 class Section(Box):
     """
     Report subsection definition
@@ -67,35 +140,42 @@ class Section(Box):
     level: int = 0
 
     def __init__(self, title, *content, orientation='vertical'):
-        super().__init__(*content, orientation=orientation)
+        super(Section, self).__init__(*content, orientation=orientation)
         self.title = title
         self.level = 0
 
-
-@dataclasses.dataclass
-class Report(Section):
-    """
-    Top-level report object for abstract report definition
-    """
-    def __init__(self, title, *content):
-        super().__init__(title, *content)
-
     def update_levels(self):
         """
-        Update section levels prior to rendering
+        Update section levels prior to rendering, treating this section as the top level
         """
-        todo = [(self, 0)]
+        self.level = 0
+        # breadth-first over sections: siblings are visited consecutively
+        sections = deque([self])
 
-        while len(todo):
-            o, l = todo.pop()
+        # local bindings for the per-node loop
+        is_instance, section_type, box_type = isinstance, Section, Box
+        add_section = sections.append
 
-            if isinstance(o, Section):
-                o.level = l
-                l += 1
+        while sections:
+            section = sections.popleft()
+            level = section.level + 1
+            # plain boxes are walked in place: their sections are one level below the enclosing one
+            boxes = deque([section])
 
-            if isinstance(o, Box):
-                todo += [(c, l) for c in o.content]
+            while boxes:
+                for c in boxes.popleft().content:
+                    if is_instance(c, section_type):
+                        c.level = level
+                        add_section(c)
+                    elif is_instance(c, box_type):
+                        boxes.append(c)
 
+
+@dataclasses.dataclass(slots=True, init=False)
+class Report(Section):
+    """
+    Top-level report object for abstract report definition
+    """
     def _repr_html_(self):
         """
         Jupyter integration
@@ -103,7 +183,7 @@ class Report(Section):
         return Engine.get_engine('html').render(self)
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class Table(Content):
     """
     Rendering for a table. Data should be pandas DataFrame
@@ -113,7 +193,7 @@ class Table(Content):
     :param column_style: callback function to return styles per column
     :param interactive: if True, render interactive table (scrollable, selectable)
     """
-    data: pandas.DataFrame = None
+    data: 'pandas.DataFrame' = None
     title: str = None
     index: bool = False
     header: bool = True
@@ -121,23 +201,44 @@ class Table(Content):
     interactive: bool = True
 
 
-@dataclasses.dataclass(frozen=True, slots=True)
+@dataclasses.dataclass(frozen=True, slots=True, weakref_slot=True)
 class TextStyle:
     """
     Text styling for tables. All values are in CSS units.
+
+    Instances are interned while in use: constructing a style with the same values returns the same object.
+    Only styles with hashable values (e.g. strings) are interned, other styles are created as is.
     """
     BOLD = 'bold'
+    _instances_ = weakref.WeakValueDictionary()
 
     size: str = None
     weight: str = None
     align: str = None
     color: str = None
 
+    def __new__(cls, size=None, weight=None, align=None, color=None):
+        key = (cls, size, weight, align, color)
+        try:
+            style = TextStyle._instances_.get(key)
+        except TypeError:
+            # unhashable value: not interned
+            return object.__new__(cls)
+        if style is None:
+            style = object.__new__(cls)
+            TextStyle._instances_[key] = style
+        return style
 
-@dataclasses.dataclass(slots=True)
+    def __reduce__(self):
+        # copy / pickle through the constructor to keep instances interned
+        return type(self), (self.size, self.weight, self.align, self.color)
+
+
+@dataclasses.dataclass(slots=True, eq=False)
 class DataSeries:
     """
     Single data series.
+    Numeric x / y lists are stored as numpy arrays (y as float64), other values are kept as is.
 
     :param title: data series name
     :param x: x values
@@ -151,8 +252,32 @@ class DataSeries:
     line: bool = True
     markers: bool = False
 
+    def __post_init__(self):
+        if isinstance(self.x, (list, tuple)) or isinstance(self.y, (list, tuple)):
+            import numpy
+
+            # ragged nested values (e.g. multi-level categories) cannot be converted: keep them as given
+            if isinstance(self.x, (list, tuple)):
+                try:
+                    x = numpy.asarray(self.x)
+                except ValueError:
+                    pass
+                else:
+                    # keep integer x as is: categorical renderers use str() of the values
+                    if x.dtype.kind in 'iuf':
+                        self.x = x
+
+            if isinstance(self.y, (list, tuple)):
+                try:
+                    y = numpy.asarray(self.y)
+                except ValueError:
+                    pass
+                else:
+                    if y.dtype.kind in 'iuf':
+                        self.y = numpy.ascontiguousarray(y, dtype=numpy.float64)
 
-@dataclasses.dataclass
+
+@dataclasses.dataclass(slots=True)
 class Annotation:
     """
     Base class for chart annotations
@@ -160,29 +285,48 @@ class Annotation:
     pass
 
 
-@dataclasses.dataclass
-class Chart(Content):
+class ChartSize(str, enum.Enum):
     """
-    Base chart class
+    Chart size hints. Members compare and hash equal to their string values.
     """
-    LARGE = 'large'  # chart size hints
+    LARGE = 'large'
     MEDIUM = 'medium'
     SMALL = 'small'
     WIDE = 'wide'
     AUTO = 'auto'  # size according to the container
 
+
+@dataclasses.dataclass(slots=True)
+class Chart(Content):
+    """
+    Base chart class
+
+    :param size: ChartSize hint (or its string value) or explicit (width, height)
+    """
+    LARGE = ChartSize.LARGE  # chart size hints
+    MEDIUM = ChartSize.MEDIUM
+    SMALL = ChartSize.SMALL
+    WIDE = ChartSize.WIDE
+    AUTO = ChartSize.AUTO
+
     title: str = None
-    series: Sequence[DataSeries] = None
-    size: str | Tuple[int, int] = MEDIUM
+    series: Tuple[DataSeries, ...] = None
+    size: ChartSize | Tuple[int, int] = MEDIUM
     annotations: Sequence[Annotation] = None
 
     def __init__(self, title, *series, size=MEDIUM, annotations=None):
-        super().__init__()
         self.title = title
-        self.series = list(series)
-        self.size = size
+        self.series = series
+        # normalize string hints so engines can compare sizes by identity
+        self.size = ChartSize(size) if isinstance(size, str) else size
         self.annotations = annotations
 
+    def cache_key(self):
+        """
+        Charts of the same type with equal settings that share the same data objects have equal keys
+        """
+        return (type(self),) + tuple(_value_key(getattr(self, f.name)) for f in dataclasses.fields(self))
+
 
 @dataclasses.dataclass(slots=True)
 class XYChart(Chart):
@@ -202,25 +346,36 @@ class LineChart(XYChart):
     """
     Simple line chart (scatter chart)
     """
-    pass
+    __slots__ = ()
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class CandlestickChart(XYChart):
     """
     OHLC (open, high, low, close) chart
     """
-    data: pandas.DataFrame = None
+    COLUMNS = frozenset(('open', 'high', 'low', 'close'))  # required data columns, 'volume' is optional
+
+    data: 'pandas.DataFrame' = None
 
-    def __init__(self, title: str, data: pandas.DataFrame, **kwargs):
+    def __init__(self, title: str, data: 'pandas.DataFrame', **kwargs):
         """
         Initialize with specified data
 
         :param title: chart title
         :param data: OHLC data
         """
-        super().__init__(title, **kwargs)
+        super(CandlestickChart, self).__init__(title, **kwargs)
         self.data = data
+        self._validate()
+
+    def _validate(self):
+        """
+        Check that data has all OHLC columns
+        """
+        missing = CandlestickChart.COLUMNS.difference(self.data.columns)
+        if missing:
+            raise ValueError(f"Candlestick data is missing columns: {', '.join(sorted(missing))}")
 
 
 @dataclasses.dataclass(slots=True)
@@ -231,17 +386,17 @@ class ComboChart(XYChart):
     bars: Sequence[DataSeries] = dataclasses.field(default_factory=list)
     lines: Sequence[DataSeries] = dataclasses.field(default_factory=list)
 
-    def __init__(self, title, bars: Sequence[DataSeries], lines: Sequence[DataSeries], **kwargs):
+    def __init__(self, title, bars: Sequence[DataSeries] = None, lines: Sequence[DataSeries] = None, **kwargs):
         super(ComboChart, self).__init__(title, **kwargs)
-        self.bars = bars
-        self.lines = lines
+        self.bars = bars if bars is not None else []
+        self.lines = lines if lines is not None else []
 
 
 class BarChart(XYChart):
     """
     Displays data series as bars
     """
-    pass
+    __slots__ = ()
 
 
 @dataclasses.dataclass(slots=True)
@@ -249,10 +404,10 @@ class ChartGroup(Content):
     """
     Displays a grid of charts with shared X axis
     """
-    charts: Sequence[XYChart] = dataclasses.field(default_factory=list)
+    charts: Tuple[XYChart, ...] = dataclasses.field(default_factory=tuple)
 
     def __init__(self, *charts: XYChart):
-        self.charts = list(charts)
+        self.charts = charts
 
 
 class SlopeAnnotation(Annotation):
@@ -261,11 +416,11 @@ class SlopeAnnotation(Annotation):
 
     Renders line y(x) = slope * x + intercept
     """
+    __slots__ = ('intercept', 'slope', 'color', 'dash', 'line_width')
+
     def __init__(self, intercept=0, slope=0, color=None, dash=None, line_width=None):
-        super().__init__()
         self.intercept = intercept
         self.slope = slope
-        self.intercept = intercept
         self.color = color
         self.dash = dash
         self.line_width = line_width
@@ -1,46 +1,127 @@
+import contextvars
+import functools
+import gzip
 import json
+import os
 import uuid
-from typing import Tuple, Dict
+from typing import Tuple, Dict, List
 
 import bokeh.embed
 import bokeh.models
 import numpy
 from bokeh.palettes import Category10_10 as palette
-# from bokeh.transform import dodge
+from bokeh.transform import dodge
 import bokeh.core.properties
 import bokeh.plotting
 import bokeh.resources
 import itertools
-from jinja2 import Environment, PackageLoader
+from jinja2 import Environment, FileSystemBytecodeCache, PackageLoader
 import numbers
 import pandas
 
-from .definitions import Engine, Report, Section, Box, Grid, Table, TextStyle, LineChart, ComboChart, BarChart, SlopeAnnotation, CandlestickChart, ChartGroup, Content, Chart
+from .definitions import Engine, Report, Section, Box, VBox, HBox, Grid, Table, TextStyle, LineChart, ComboChart, BarChart, SlopeAnnotation, CandlestickChart, ChartGroup, Content, Chart, ChartSize
 # TODO: move the function definition into reports
-from pyutils.bokehutils import bars, add_crosshair
+from pyutils.bokehutils import add_crosshair
 
 # pre-defined chart sizes
 CHART_SIZE = {
-    LineChart.SMALL: (200, 200),
-    LineChart.MEDIUM: (500, 350),
-    LineChart.LARGE: (700, 450),
-    LineChart.WIDE: (1000, 350)
+    ChartSize.SMALL: (200, 200),
+    ChartSize.MEDIUM: (500, 350),
+    ChartSize.LARGE: (700, 450),
+    ChartSize.WIDE: (1000, 350)
 }
 
+# width / height keyword arguments of bokeh figures for the pre-defined sizes
+_CHART_SIZE_DICT = {size: {'width': width, 'height': height} for size, (width, height) in CHART_SIZE.items()}
+
+# BokehJS resources the pages load
+_CDN = bokeh.resources.CDN
+
+# rendered output by Content.cache_key(), local to one render() / render_stream() call:
+# engines are shared between threads (Engine.get_engine), so the cache cannot live on the instance
+_RENDER_CACHE = contextvars.ContextVar('render_cache')
+
 DEFAULT_TOOLS = "pan,box_zoom,xwheel_zoom,reset,hover,crosshair"
 
+# directory for a persistent cache of compiled templates (opt-in, reused by later processes)
+_TEMPLATE_CACHE_VAR = 'REPORTS_TEMPLATE_CACHE'
+
+
+def _bytecode_cache():
+    """
+    Template bytecode cache in the directory named by the REPORTS_TEMPLATE_CACHE environment variable.
+    Returns None if the variable is not set or the directory cannot be used.
+    """
+    directory = os.environ.get(_TEMPLATE_CACHE_VAR)
+    if not directory:
+        return None
+    try:
+        os.makedirs(directory, exist_ok=True)
+        return FileSystemBytecodeCache(directory)
+    except OSError:
+        return None
+
+
+# template environment shared by all engines, so each template is compiled once per process.
+# templates are shipped with the package: no need to check them for changes.
+_ENV = Environment(
+    loader=PackageLoader('reports', 'templates'), auto_reload=False, cache_size=400,
+    bytecode_cache=_bytecode_cache())
+
+# compact JSON encoder for table payloads, orjson is used when available
+try:
+    import orjson
+
+    def _dumps(obj) -> str:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+except ImportError:
+    def _dumps(obj) -> str:
+        return json.dumps(obj, separators=(',', ':'))
+
 
 class HtmlEngine(Engine):
     """
     HTML report rendering using jinja2 templates
     """
+    # chart renderer method names by chart type
+    _CHART_RENDERERS = {
+        BarChart: '_render_bar_chart',
+        LineChart: '_render_line_chart',
+        ComboChart: '_render_combo_chart',
+        CandlestickChart: '_render_candlestick_chart'
+    }
+
     def __init__(self, template='report.html', inline=True):
-        self._env = None
+        self._env = _ENV
         self._defaults = {
             'render': self._render,
             'is_inline': inline
         }
-        self._template = template
+        self._template = self._env.get_template(template)
+        self._box_template = self._env.get_template('box.html')
+        self._section_template = self._env.get_template('section.html')
+        self._grid_template = self._env.get_template('grid.html')
+        # BokehJS script tags for the page header
+        self._bokeh_resources = _bokeh_resources()
+
+        # dispatch table indexed by Content._tag_
+        renderers = {
+            Report: self._render_report,
+            Section: self._render_section,
+            Box: self._render_box,
+            VBox: self._render_box,
+            HBox: self._render_box,
+            Grid: self._render_grid,
+            Table: self._render_table,
+            ChartGroup: self._render_chart_group,
+            LineChart: self._render_chart,
+            BarChart: self._render_chart,
+            ComboChart: self._render_chart,
+            CandlestickChart: self._render_chart
+        }
+        self._renderers = [None] * (max(cls._tag_ for cls in renderers) + 1)
+        for cls, renderer in renderers.items():
+            self._renderers[cls._tag_] = renderer
 
     def render(self, report: Report) -> str:
         """
@@ -48,105 +129,139 @@ class HtmlEngine(Engine):
 
         :param report: Report object
         """
-        self._env = Environment(
-            loader=PackageLoader('reports', 'templates'))
+        # update section levels
+        report.update_levels()
+
+        token = _RENDER_CACHE.set({})
+        try:
+            return self._template.render(
+                data=report, bokeh_resources=self._bokeh_resources, **self._defaults
+            )
+        finally:
+            _RENDER_CACHE.reset(token)
+
+    def render_stream(self, report: Report, out):
+        """
+        Render report into a text stream chunk by chunk, without building the whole HTML string.
+        Nested content is still rendered into strings one item at a time.
 
+        :param report: Report object
+        :param out: writable text stream or file name
+        """
         # update section levels
         report.update_levels()
-        template = self._env.get_template(self._template)
 
-        return template.render(
-            data=report, **self._defaults
-        )
+        token = _RENDER_CACHE.set({})
+        try:
+            self._template.stream(
+                data=report, bokeh_resources=self._bokeh_resources, **self._defaults
+            ).dump(out)
+        finally:
+            _RENDER_CACHE.reset(token)
+
+    @staticmethod
+    def _get_cache() -> dict:
+        """
+        Cache of the current render() call, empty outside of it
+        """
+        return _RENDER_CACHE.get({})
 
     def _render(self, obj: Content) -> str:
         """
         Render a content object
         """
-        obj_map = {
-            Report: self._render_report,
-            Section: self._render_section,
-            Box: self._render_box,
-            Grid: self._render_grid,
-            Table: self._render_table,
-            ChartGroup: self._render_chart_group
-        }
-
-        if isinstance(obj, Chart):
-            return self._render_chart(obj)
+        tag = getattr(obj, '_tag_', 0)
+        renderer = self._renderers[tag] if tag < len(self._renderers) else None
 
-        if type(obj) not in obj_map:
+        if renderer is None:
             raise Exception("Unknown content type: " + str(type(obj)))
 
-        return obj_map[type(obj)](obj)
+        return renderer(obj)
 
     def _render_report(self, obj: Report) -> str:
         """
         Render top-level report object
         """
-        if obj.level == 0:
-            box = self._env.get_template('box.html')
-        else:
-            box = self._env.get_template('section.html')
+        box = self._box_template if obj.level == 0 else self._section_template
         return box.render(data=obj, **self._defaults)
 
     def _render_section(self, obj: Section) -> str:
         """
         Render a subsection
         """
-        box = self._env.get_template('section.html')
-        return box.render(data=obj, **self._defaults)
+        return self._section_template.render(data=obj, **self._defaults)
 
     def _render_box(self, obj: Box) -> str:
         """
         Render a horizontal / vertical group of content
         """
-        box = self._env.get_template('box.html')
-        return box.render(data=obj, **self._defaults)
+        if len(obj.content) == 1:
+            # same markup as box.html without the template call
+            css_class = 'reports-vbox' if obj.orientation == 'vertical' else 'reports-hbox'
+            return f'<div class={css_class}>\n{self._render(obj.content[0])}\n</div>'
+        return self._box_template.render(data=obj, **self._defaults)
 
     def _render_grid(self, obj: Grid) -> str:
         """
         Render grid of objects
         """
-        grid = self._env.get_template('grid.html')
-        return grid.render(data=obj, **self._defaults)
+        if len(obj.content) == 1:
+            # same markup as grid.html without the template call
+            return f'<div class="reports-grid">\n{self._render(obj.content[0])}\n</div>'
+        return self._grid_template.render(data=obj, **self._defaults)
 
-    def _render_interactive_table(self, obj: Table) -> str:
+    def _interactive_table_data(self, obj: Table) -> Tuple[str, str]:
         """
-        Render interactive table using jspreadsheets-ce package.
+        Convert table into jspreadsheet data and column definitions (as JSON strings)
         """
         df = obj.data
 
-        data = [list() for _ in range(df.shape[0])]
+        # values are converted a column at a time and serialized by pandas straight from the column buffers
+        values = {}
         columns = []
 
-        for cname, dtype in zip(df.columns, df.dtypes):
+        for i, (cname, column) in enumerate(df.items()):
             col = {'title': str(cname)}
 
-            if numpy.issubdtype(dtype, float):
+            if pandas.api.types.is_float_dtype(column.dtype):
                 col['type'] = 'numeric'
-                for i, val in enumerate(df[cname].values):
-                    data[i].append(float(val))
-            elif numpy.issubdtype(dtype, int):
+                values[i] = column.astype('float64')
+            elif pandas.api.types.is_integer_dtype(column.dtype):
+                # to_json handles all integer widths (incl. uint64) and nullable NA as is
                 col['type'] = 'numeric'
-                for i, val in enumerate(df[cname].values):
-                    data[i].append(int(val))
+                values[i] = column
+            elif pandas.api.types.is_datetime64_any_dtype(column.dtype):
+                col['type'] = 'text'
+                values[i] = column.dt.strftime('%Y-%m-%d %H:%M:%S').where(column.notna(), '')
             else:
                 col['type'] = 'text'
-                for i, val in enumerate(df[cname].values):
-                    data[i].append(str(val))
+                values[i] = column.astype(str)
 
             columns.append(col)
 
+        data = pandas.DataFrame(values, index=df.index).to_json(orient='values', double_precision=15)
+        return data, _dumps(columns)
+
+    def _render_interactive_table(self, obj: Table) -> str:
+        """
+        Render interactive table using jspreadsheets-ce package.
+        """
+        # the element id must be unique per occurrence, only the table data is shared
+        cache = self._get_cache()
+        key = obj.cache_key()
+        if key not in cache:
+            cache[key] = self._interactive_table_data(obj)
+        data, columns = cache[key]
+
         div_id = str(uuid.uuid4())
 
         return f'''
             <div id="{div_id}"></div>
             <script>
-                var data = {json.dumps(data)};
+                var data = {data};
                 jspreadsheet(document.getElementById('{div_id}'), {{
                     data: data,
-                    columns: {json.dumps(columns)},
+                    columns: {columns},
                     editable: false,
                     columnResize: true,
                     columnDrag: false,
@@ -159,6 +274,15 @@ class HtmlEngine(Engine):
         """
         Render static HTML table
         """
+        if not obj.column_style:
+            # nothing to style per cell: skip the Styler machinery, formatting cells the way the Styler does
+            precision = pandas.get_option('styler.format.precision')
+            return obj.data.to_html(
+                classes='table table-bordered table-sm table-responsive table-striped',
+                header=obj.header, index=obj.index, border=0, escape=False,
+                float_format=lambda v: f'{v:.{precision}f}',
+                na_rep=pandas.get_option('styler.format.na_rep') or 'nan')
+
         style = obj.data.style.set_table_attributes('class="table table-bordered table-sm table-responsive table-striped"')
         table_styles = []
         if not obj.header:
@@ -184,7 +308,14 @@ class HtmlEngine(Engine):
                 if not isinstance(obj.column_style, dict):
                     raise Exception("Column style should be a callback or a dictionary")
                 d = obj.column_style
-                style = style.apply(lambda x: self._apply_style(x, d.get(x.name, None)), axis=0)
+                # only styled columns go through the Styler
+                styled = [c for c in obj.data.columns if d.get(c) is not None]
+                # CSS for plain TextStyle entries does not depend on the values: convert once per column
+                css = {c: self._text_style_to_css(d[c]) for c in styled if isinstance(d[c], TextStyle)}
+                if styled:
+                    style = style.apply(
+                        lambda x: pandas.Series(css[x.name], index=x.index) if x.name in css else self._apply_style(x, d[x.name]),
+                        axis=0, subset=styled)
 
         return style.to_html()
 
@@ -194,33 +325,96 @@ class HtmlEngine(Engine):
         """
         if obj.interactive:
             return self._render_interactive_table(obj)
-        else:
-            return self._render_html_table(obj)
+
+        cache = self._get_cache()
+        key = obj.cache_key()
+        if key not in cache:
+            cache[key] = self._render_html_table(obj)
+        return cache[key]
 
     @staticmethod
     def _chart_size(size: str | Tuple[int, int]) -> Dict[str, int]:
         """
         Convert size to width / height
         """
-        return {
-            'width': CHART_SIZE[size][0] if isinstance(size, str) else size[0],
-            'height': CHART_SIZE[size][1] if isinstance(size, str) else size[1]
-        }
+        if isinstance(size, str):
+            # shared dict: callers only unpack it
+            return _CHART_SIZE_DICT[size]
+        return {'width': size[0], 'height': size[1]}
+
+    @staticmethod
+    def _series_colors(series) -> List[str]:
+        """
+        Resolve series colors: explicit series color or the next palette color
+        """
+        colors = []
+        auto = 0  # number of palette colors taken so far
+        for s in series:
+            if s.color is not None:
+                colors.append(s.color)
+            else:
+                colors.append(palette[auto % len(palette)])
+                auto += 1
+        return colors
 
-    def _render_line_chart(self, obj: LineChart) -> bokeh.plotting.figure:
+    @staticmethod
+    def _point_colors(colors, lengths) -> List[str]:
+        """
+        Color column of series batched into one glyph: per-point color lists are used as is, single colors repeated
+
+        :param colors: color of each series (single color or color per point)
+        :param lengths: number of points of each series
+        """
+        column = []
+        for color, n in zip(colors, lengths):
+            column.extend(color if isinstance(color, (list, tuple, numpy.ndarray)) else [color] * n)
+        return column
+
+    @staticmethod
+    def _add_legend(fig: bokeh.plotting.figure, items: List[Tuple[str, bokeh.models.GlyphRenderer, int]]):
+        """
+        Add a legend of (label, renderer, index) items, index selects the series drawn by a batched glyph
+        """
+        if items:
+            fig.add_layout(bokeh.models.Legend(items=[
+                bokeh.models.LegendItem(label=label, renderers=[renderer], index=index) for label, renderer, index in items
+            ]))
+
+    @staticmethod
+    def _x_factors(chart: Chart) -> List[str] | None:
+        """
+        Categories of the chart X axis in axis order, None if the X axis is numeric
+        """
+        if isinstance(chart, BarChart):
+            return list(dict.fromkeys(str(v) for s in chart.series for v in s.x))
+        if isinstance(chart, ComboChart):
+            return list(dict.fromkeys(str(v) for s in itertools.chain(chart.lines, chart.bars) for v in s.x))
+        if isinstance(chart, LineChart) and len(chart.series) and len(chart.series[0].x) \
+                and not isinstance(chart.series[0].x[0], numbers.Number):
+            values = numpy.concatenate([numpy.asarray(s.x) for s in chart.series if len(s.x)])
+            try:
+                # sorted unique categories of all series
+                return numpy.unique(values).tolist()
+            except TypeError:
+                # values that cannot be ordered (e.g. mixed types): keep the order of appearance
+                return list(dict.fromkeys(values.tolist()))
+        return None
+
+    def _render_line_chart(self, obj: LineChart, x_range=None) -> bokeh.plotting.figure:
         """
         Render a line chart using bokeh
 
         :param obj: LineChart
+        :param x_range: X range shared with other charts (optional)
         """
-        # non-numeric X axis:
         extra = {}
-        if len(obj.series) and len(obj.series[0].x) and not isinstance(obj.series[0].x[0], numbers.Number):
-            x_range = set()
-            for s in obj.series:
-                x_range |= set(s.x)
-
-            extra['x_range'] = bokeh.models.FactorRange(*sorted(x_range))
+        if x_range is not None:
+            extra['x_range'] = x_range
+        else:
+            # non-numeric X axis:
+            factors = self._x_factors(obj)
+            if factors is not None:
+                extra['x_range'] = bokeh.models.FactorRange(*factors)
 
         fig = bokeh.plotting.figure(
             # toolbar_location=None,
@@ -233,18 +427,36 @@ class HtmlEngine(Engine):
         if obj.annotations:
             self._render_annotations(fig, obj.annotations)
 
-        colors = itertools.cycle(palette)
-
+        colors = self._series_colors(obj.series)
+        assert all(s.line or s.markers for s in obj.series)
+
+        # all lines are drawn by one multi_line glyph
+        lines = [(s, color) for s, color in zip(obj.series, colors) if s.line]
+        if lines:
+            line_glyph = fig.multi_line(xs='xs', ys='ys', color='color', source=bokeh.models.ColumnDataSource({
+                'xs': [numpy.asarray(s.x) for s, _ in lines],
+                'ys': [numpy.asarray(s.y) for s, _ in lines],
+                'color': [color for _, color in lines]
+            }))
+
+        # all markers are drawn by one glyph over the concatenated points
+        markers = [(s, color) for s, color in zip(obj.series, colors) if s.markers]
+        if markers:
+            marker_glyph = fig.scatter(x='x', y='y', color='color', source=bokeh.models.ColumnDataSource({
+                'x': numpy.concatenate([numpy.asarray(s.x) for s, _ in markers]),
+                'y': numpy.concatenate([numpy.asarray(s.y) for s, _ in markers]),
+                'color': self._point_colors([color for _, color in markers], [len(s.y) for s, _ in markers])
+            }))
+
+        # legend items select the series within the batched glyphs
+        legend = []
+        line_idx = marker_idx = 0
         for s in obj.series:
-            color = next(colors) if s.color is None else s.color
-            extra = {'legend_label': s.title} if s.title else {}
-            assert s.line or s.markers
-
-            if s.line:
-                fig.line(x=s.x, y=s.y, **extra, color=color)
-
-            if s.markers:
-                fig.circle(x=s.x, y=s.y, color=color, **(extra if not s.line else {}))
+            if s.title:
+                legend.append((s.title, line_glyph, line_idx) if s.line else (s.title, marker_glyph, marker_idx))
+            line_idx += bool(s.line)
+            marker_idx += len(s.y) if s.markers else 0
+        self._add_legend(fig, legend)
 
         if obj.x_axis_title:
             fig.xaxis.axis_label = obj.x_axis_title
@@ -261,81 +473,88 @@ class HtmlEngine(Engine):
 
         return fig
 
-    def _render_bar_chart(self, obj: BarChart) -> bokeh.plotting.figure:
+    def _render_bar_chart(self, obj: BarChart, x_range=None) -> bokeh.plotting.figure:
         """
         Render a bar chart using bokeh
 
         :param obj: BarChart
-        """
-        data = pandas.DataFrame({
-            's' + str(i): pandas.Series(s.y, index=[str(v) for v in s.x]) for i, s in enumerate(obj.series)
-        })
+        :param x_range: X range shared with other charts (optional)
+        """
+        xs = [[str(v) for v in s.x] for s in obj.series]
+        # align all series on the ordered union of categories, missing values are 0
+        x_values = list(dict.fromkeys(itertools.chain.from_iterable(xs)))
+        x_index = {v: i for i, v in enumerate(x_values)}
+        columns = {'x': x_values}
+        for idx, (s, x) in enumerate(zip(obj.series, xs)):
+            y = numpy.zeros(len(x_values))
+            y[[x_index[v] for v in x]] = s.y
+            y[numpy.isnan(y)] = 0
+            columns['s' + str(idx)] = y
         # TODO: add color handling through data (so that proper index is used)
-        data.index.name = 'x'
-        data = data.reset_index().fillna(0)
-        source = bokeh.models.ColumnDataSource(data)
+        source = bokeh.models.ColumnDataSource(columns)
 
         fig = bokeh.plotting.figure(
             # toolbar_location=None,
             tools=DEFAULT_TOOLS,
             title=obj.title,
-            x_range=data['x'].values,  # categorical values must be str()
+            x_range=x_range if x_range is not None else x_values,  # categorical values must be str()
             **self._chart_size(obj.size)
         )
 
-        colors = itertools.cycle(palette)
+        colors = self._series_colors(obj.series)
+        # series bars are placed side by side within the 0.8 wide category slot
+        width = 0.8 / max(len(obj.series), 1)
 
         for idx, s in enumerate(obj.series):
-            bars(fig, x='x', y='s' + str(idx), num_total=len(obj.series), this_index=idx,
-                 source=source, legend_label=s.title,
-                 color=s.color if s.color is not None else next(colors))
-            # fig.vbar(x=dodge('x', - width/2 + idx * width, range=fig.x_range),
-            #          top='s' + str(idx), source=source,
-            #          legend_label=s.title, width=width * 0.9,
-            #          color=s.color if s.color is not None else next(colors))
+            extra = {'legend_label': s.title} if s.title else {}
+            fig.vbar(x=dodge('x', (idx - (len(obj.series) - 1) / 2) * width, range=fig.x_range),
+                     top='s' + str(idx), source=source, width=width * 0.9, color=colors[idx], **extra)
 
         # disable legend
-        if len(obj.series) <= 1:
+        if len(obj.series) <= 1 and len(fig.legend):
             fig.legend[0].visible = False
 
         return fig
 
-    def _render_candlestick_chart(self, obj: CandlestickChart) -> bokeh.plotting.figure:
+    def _render_candlestick_chart(self, obj: CandlestickChart, x_range=None) -> bokeh.plotting.figure:
         """
         Render OHLC chart to the report
 
         :param obj:
+        :param x_range: X range shared with other charts (optional)
         :return:
         """
         data = obj.data
-        green = data['close'] >= data['open']
-        colors = numpy.array(['#FF0000'] * len(data.index))
-        colors[green] = '#00AA00'
+        # column arrays, extracted once
+        opens, highs, lows, closes = (data[c].to_numpy() for c in ('open', 'high', 'low', 'close'))
+        colors = numpy.where(closes >= opens, '#00AA00', '#FF0000')
         index = numpy.arange(len(data.index))
+        # time labels for the tooltip and the axis
+        labels = data.index.astype(str).to_numpy()
 
         fig = bokeh.plotting.figure(
             title=obj.title,
             tools=DEFAULT_TOOLS,
             **self._chart_size(obj.size),
+            **({'x_range': x_range} if x_range is not None else {})
         )
 
         width = 0.6
-        fig.segment(index, data.high, index, data.low, color="black")
+        fig.segment(index, highs, index, lows, color="black")
         source = bokeh.models.ColumnDataSource({
             'x': index,
-            'width': [width] * index.shape[0],
-            'top': numpy.maximum(data['open'].values, data['close'].values),
-            'bottom': numpy.minimum(data['open'].values, data['close'].values),
+            'top': numpy.maximum(opens, closes),
+            'bottom': numpy.minimum(opens, closes),
             'color': colors,
             # for tooltip
-            'time': list(map(str, data.index.values)),
-            'open': data['open'].values,
-            'high': data['high'].values,
-            'low': data['low'].values,
-            'close': data['close'].values
+            'time': labels,
+            'open': opens,
+            'high': highs,
+            'low': lows,
+            'close': closes
         })
 
-        bars = fig.vbar(x='x', width='width', top='top', bottom='bottom', source=source,
+        bars = fig.vbar(x='x', width=width, top='top', bottom='bottom', source=source,
                         fill_color='color', line_color="black")
 
         # modify hover tool:
@@ -354,41 +573,42 @@ class HtmlEngine(Engine):
         """
 
         fig.xaxis.formatter = bokeh.models.CustomJSTickFormatter(code=formatter, args={
-            'labels': [str(v) for v in data.index]
+            'labels': labels.tolist()
         })
 
-        if 'volume' in data.columns and numpy.any(data['volume'].values):
+        volume = data['volume'].to_numpy() if 'volume' in data.columns else None
+        if volume is not None and numpy.any(volume):
             # Adding extra Y range seems to affect the default range calculation (implemented in DataRange1d)
             # We override the default Y range with explicit calculation.
             # This may affect the plot if extra rendering is performed later.
             # One way to fix this is to explicitly assign relevant subset of renderers to DataRange1d.
-            default_top = data['high'].max()
-            default_bot = data['low'].min()
+            default_top = numpy.nanmax(highs)
+            default_bot = numpy.nanmin(lows)
             fig.y_range = bokeh.models.Range1d(1.05 * default_bot - 0.05 * default_top,
                                                1.05 * default_top - 0.05 * default_bot)
 
-            volume = data['volume'].values
             fig.extra_y_ranges = {"volume": bokeh.models.Range1d(start=0, end=volume.max() * 5)}
             fig.add_layout(bokeh.models.LinearAxis(y_range_name="volume"), 'right')
-            fig.vbar(x=index, width=0.8, bottom=numpy.zeros(len(index)), top=volume,
+            fig.vbar(x=index, width=0.8, bottom=0, top=volume,
                      fill_color=colors, y_range_name='volume', alpha=0.5, level='underlay')
 
         return fig
 
-    def _render_combo_chart(self, obj: ComboChart) -> str:
+    def _render_combo_chart(self, obj: ComboChart, x_range=None) -> str:
         """
         Render a combination of lines and bars on the same chart.
         The X axis is assumed to be categorical.
 
         :param obj: ComboChart
+        :param x_range: X range shared with other charts (optional)
         :return: HTML
         """
-        x_range = []
-        for s in obj.lines + obj.bars:
-            for v in s.x:
-                v = str(v)
-                if v not in x_range:
-                    x_range.append(v)
+        # categorical x values of each series, converted once
+        bar_x = [[str(v) for v in s.x] for s in obj.bars]
+        line_x = [[str(v) for v in s.x] for s in obj.lines]
+        if x_range is None:
+            # ordered unique categories
+            x_range = list(dict.fromkeys(itertools.chain.from_iterable(line_x + bar_x)))
 
         fig = bokeh.plotting.figure(
             # toolbar_location=None,
@@ -398,66 +618,95 @@ class HtmlEngine(Engine):
             **self._chart_size(obj.size)
         )
 
-        colors = itertools.cycle(palette)
+        # lines always take palette colors, following the ones used by bars
+        bar_colors = self._series_colors(obj.bars)
+        auto = sum(s.color is None for s in obj.bars)
+        line_colors = [palette[(auto + i) % len(palette)] for i in range(len(obj.lines))]
 
         # render bars:
         fig.extra_y_ranges['y2'] = bokeh.models.DataRange1d()
         fig.add_layout(bokeh.models.LinearAxis(y_range_name='y2'), 'right')
 
-        bars = []
-        for s in obj.bars:
-            bars.append(fig.vbar(x=[str(v) for v in s.x], top=s.y, width=0.8, legend_label=s.title, y_range_name='y2',
-                                 color=s.color if s.color is not None else next(colors)))
-        fig.extra_y_ranges['y2'].renderers = bars
-
-        # render lines
-        for s in obj.lines:
-            color = next(colors)
+        legend = []
+        if obj.bars:
+            # all bars are drawn by one glyph over the concatenated points
+            bar_glyph = fig.vbar(x='x', top='top', width=0.8, color='color', y_range_name='y2',
+                                 source=bokeh.models.ColumnDataSource({
+                                     'x': list(itertools.chain.from_iterable(bar_x)),
+                                     'top': numpy.concatenate([numpy.asarray(s.y, dtype='float64') for s in obj.bars]),
+                                     'color': self._point_colors(bar_colors, [len(x) for x in bar_x])
+                                 }))
+            fig.extra_y_ranges['y2'].renderers = [bar_glyph]
+            offsets = itertools.accumulate([0] + [len(x) for x in bar_x])
+            legend += [(s.title, bar_glyph, idx) for s, idx in zip(obj.bars, offsets) if s.title]
+
+        if obj.lines:
             # TODO: sort line values
-            fig.line(x=[str(v) for v in s.x], y=s.y, legend_label=s.title, color=color)
-            fig.circle(x=[str(v) for v in s.x], y=s.y, size=6, fill_color='white', color=color)
+            line_glyph = fig.multi_line(xs='xs', ys='ys', color='color', source=bokeh.models.ColumnDataSource({
+                'xs': line_x,
+                'ys': [numpy.asarray(s.y) for s in obj.lines],
+                'color': line_colors
+            }))
+            fig.scatter(x='x', y='y', size=6, fill_color='white', color='color', source=bokeh.models.ColumnDataSource({
+                'x': list(itertools.chain.from_iterable(line_x)),
+                'y': numpy.concatenate([numpy.asarray(s.y, dtype='float64') for s in obj.lines]),
+                'color': self._point_colors(line_colors, [len(x) for x in line_x])
+            }))
+            legend += [(s.title, line_glyph, idx) for idx, s in enumerate(obj.lines) if s.title]
+
+        self._add_legend(fig, legend)
 
         # disable legend
-        if len(obj.lines) <= 1 and len(obj.bars) <= 1:
+        if len(obj.lines) <= 1 and len(obj.bars) <= 1 and len(fig.legend):
             fig.legend[0].visible = False
 
         return fig
 
-    def _render_chart(self, chart: Chart, as_string=True) -> str | bokeh.plotting.figure:
+    def _render_chart(self, chart: Chart, as_string=True, x_range=None) -> str | bokeh.plotting.figure:
         """
         Render specified chart
+
+        :param as_string: if False, return a new bokeh figure
+        :param x_range: X range shared with other charts, only used when returning a figure
         """
-        renderers = {
-            BarChart: self._render_bar_chart,
-            LineChart: self._render_line_chart,
-            ComboChart: self._render_combo_chart,
-            CandlestickChart: self._render_candlestick_chart
-        }
-        if type(chart) not in renderers:
+        renderer = self._CHART_RENDERERS.get(type(chart))
+        if renderer is None:
             raise Exception("Unknown chart type")
 
-        fig = renderers[type(chart)](chart)
+        if not as_string:
+            # the caller may modify the figure (e.g. link axes): always build a new one
+            return getattr(self, renderer)(chart, x_range=x_range)
 
-        if as_string:
-            return bokeh.embed.file_html(fig, bokeh.resources.CDN)
+        # repeated / identical charts share the figure, each occurrence is embedded separately
+        cache = self._get_cache()
+        key = chart.cache_key()
+        if key not in cache:
+            cache[key] = getattr(self, renderer)(chart)
 
-        return fig
+        # BokehJS itself is loaded once by the page template
+        script, div = bokeh.embed.components(cache[key])
+        return script + div
 
     def _render_chart_group(self, group: ChartGroup) -> str:
         """
         Renders a group of axis-aligned charts
         """
-        charts = []
-
-        for chart in group.charts:
-            charts.append(self._render_chart(chart, as_string=False))
+        # single X range model shared by all charts, categorical if all charts are categorical
+        factors = [self._x_factors(chart) for chart in group.charts]
+        if factors and all(f is not None for f in factors):
+            x_range = bokeh.models.FactorRange(*dict.fromkeys(itertools.chain.from_iterable(factors)))
+        elif any(f is not None for f in factors):
+            raise ValueError("Charts in a group should all have either categorical or numeric X axis")
+        else:
+            x_range = bokeh.models.DataRange1d()
 
-        for chart in charts[1:]:
-            chart.x_range = charts[0].x_range
+        charts = [self._render_chart(chart, as_string=False, x_range=x_range) for chart in group.charts]
 
         add_crosshair(*charts)
 
-        return bokeh.embed.file_html(bokeh.plotting.gridplot([[chart] for chart in charts]))
+        # BokehJS itself is loaded once by the page template
+        script, div = bokeh.embed.components(bokeh.plotting.gridplot([[chart] for chart in charts]))
+        return script + div
 
     def _apply_style(self, series, style):
         """
@@ -470,11 +719,15 @@ class HtmlEngine(Engine):
             style = style(series)
 
         if hasattr(style, '__len__'):
-            style = [self._text_style_to_css(s) if s is not None else '' for s in style]
-        else:
-            style = self._text_style_to_css(style) if style is not None else ''
-            style = [style] * len(series)
-        return pandas.Series(style, index=series.index)
+            # convert each distinct style once, then map the cells in a single vectorized pass
+            styles = pandas.Series(numpy.asarray(style, dtype=object), index=series.index)
+            try:
+                return styles.map({s: self._text_style_to_css(s) for s in pandas.unique(styles)})
+            except TypeError:
+                # unhashable styles (e.g. a list color): convert cell by cell
+                return styles.map(self._text_style_to_css)
+
+        return pandas.Series(self._text_style_to_css(style), index=series.index)
 
     def _text_style_to_css(self, text_style):
         """
@@ -483,18 +736,11 @@ class HtmlEngine(Engine):
         if text_style is None:
             return ''
 
-        result = []
-
-        if text_style.weight == TextStyle.BOLD:
-            result.append('font-weight: bold')
-
-        if text_style.size:
-            result.append('font-size: {}'.format(text_style.size))
-
-        if text_style.color is not None:
-            result.append('color: {}'.format(text_style.color))
-
-        return '; '.join(result)
+        try:
+            return _style_css(text_style.weight, text_style.size, text_style.color)
+        except TypeError:
+            # unhashable values bypass the cache
+            return _style_css.__wrapped__(text_style.weight, text_style.size, text_style.color)
 
     def _render_annotations(self, figure, annotations):
         """
@@ -513,20 +759,54 @@ class HtmlEngine(Engine):
                 raise NotImplementedError()
 
 
+@functools.lru_cache(maxsize=256)
+def _style_css(weight, size, color) -> str:
+    """
+    Build CSS for the specified TextStyle values (memoized: tables typically use a handful of styles)
+    """
+    result = []
+
+    if weight == TextStyle.BOLD:
+        result.append('font-weight: bold')
+
+    if size:
+        result.append(f'font-size: {size}')
+
+    if color is not None:
+        result.append(f'color: {color}')
+
+    return '; '.join(result)
+
+
+@functools.lru_cache(maxsize=None)
+def _bokeh_resources() -> str:
+    """
+    BokehJS script tags, rendered once per process
+    """
+    return _CDN.render()
+
+
 Engine._engines_['html'] = HtmlEngine
 
 
-def save_report(report, file):
+def save_report(report, file, compress=False):
     """
     Save report as HTML file
 
     :param report:
     :param file:
+    :param compress: if True, write gzip-compressed HTML (e.g. report.html.gz)
     :return:
     """
     eng = HtmlEngine()
 
-    with open(file, 'w') as stream:
-        stream.write(eng.render(report))
+    if compress:
+        stream = gzip.open(file, 'wt', encoding='utf-8')
+    else:
+        # the template is streamed in many small chunks: let a large buffer batch the writes
+        stream = open(file, 'w', encoding='utf-8', buffering=1 << 20)
+
+    with stream:
+        eng.render_stream(report, stream)
 
     return report
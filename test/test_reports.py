@@ -1,8 +1,16 @@
+import copy
+import gzip
+import os
+import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from unittest import TestCase
 
+import bokeh.models
+import numpy
 import pandas
-from reports.html_engine import HtmlEngine
-from reports import Report, Section, Table, LineChart, DataSeries, ChartGroup, CandlestickChart
+from reports.html_engine import HtmlEngine, save_report
+from reports import Report, Section, Box, VBox, HBox, Grid, Table, LineChart, BarChart, ComboChart, DataSeries, ChartGroup, CandlestickChart, TextStyle
 
 
 class TestReports(TestCase):
@@ -52,3 +60,238 @@ class TestReports(TestCase):
         html = HtmlEngine().render(report)
         with open('/tmp/kuku.html', 'w') as s:
             s.write(html)
+
+    def test_update_levels(self):
+        """
+        Test section level assignment
+        """
+        inner = Section("Inner")
+        nested = Section("Nested", Box(inner))
+        report = Report("Report", nested, Section("Sibling"))
+
+        report.update_levels()
+        self.assertEqual([report.level, nested.level, inner.level, report.content[1].level], [0, 1, 2, 1])
+
+    def test_text_style_interning(self):
+        """
+        Test that equal text styles share a single instance
+        """
+        style = TextStyle(weight=TextStyle.BOLD, color='red')
+        self.assertIs(style, TextStyle(None, TextStyle.BOLD, color='red'))
+        self.assertIsNot(style, TextStyle(weight=TextStyle.BOLD))
+        self.assertIs(copy.copy(style), style)
+
+        # unused styles are dropped from the intern table, unhashable values are not interned
+        count = len(TextStyle._instances_)
+        TextStyle(color='#123456')
+        self.assertEqual(len(TextStyle._instances_), count)
+        self.assertEqual(TextStyle(color=['red']).color, ['red'])
+
+    def test_ragged_series(self):
+        """
+        Test that values numpy cannot convert are kept as given
+        """
+        x = [('a', 'b'), ('c',)]
+        y = [1, [2, 3]]
+        series = DataSeries(x=x, y=y)
+        self.assertIs(series.x, x)
+        self.assertIs(series.y, y)
+
+    def test_point_colors(self):
+        """
+        Test batched glyphs with single and per-point series colors
+        """
+        engine = HtmlEngine()
+        combo = ComboChart("Combo", bars=[
+            DataSeries(x=['a', 'b', 'c'], y=[1, 2, 3], color=['red', 'green', 'blue'], title="per point"),
+            DataSeries(x=['a', 'b'], y=[4, 5], color='black', title="single")
+        ])
+        fig = engine._render_combo_chart(combo)
+        bars = [r for r in fig.renderers if isinstance(r.glyph, bokeh.models.VBar)]
+        self.assertEqual(len(bars), 1)
+        self.assertEqual(list(bars[0].data_source.data['color']), ['red', 'green', 'blue', 'black', 'black'])
+
+        chart = LineChart("Markers",
+                          DataSeries(x=[1, 2, 3], y=[1, 2, 3], color=['red', 'green', 'blue'], line=False, markers=True),
+                          DataSeries(x=[1, 2], y=[3, 4], color='black', line=False, markers=True))
+        fig = engine._render_line_chart(chart)
+        markers = [r for r in fig.renderers if isinstance(r.glyph, bokeh.models.Scatter)]
+        self.assertEqual(list(markers[0].data_source.data['color']), ['red', 'green', 'blue', 'black', 'black'])
+
+        engine.render(Report("Colors", combo, chart))
+
+    def test_interactive_table_integers(self):
+        """
+        Test that integer columns of any width are serialized exactly
+        """
+        data = pandas.DataFrame({
+            'u': numpy.array([2 ** 64 - 1, 0], dtype='uint64'),
+            'i': pandas.array([None, 1], dtype='Int64')
+        })
+        rows, _ = HtmlEngine()._interactive_table_data(Table(data))
+        self.assertEqual(rows, '[[18446744073709551615,null],[0,1]]')
+
+    def test_static_table(self):
+        """
+        Test that unstyled tables format cells the same way as styled ones
+        """
+        data = pandas.DataFrame({'f': [1.5, numpy.nan], 's': ['<b>x</b>', None], 'i': [1, 2]})
+        engine = HtmlEngine()
+        plain = engine._render_html_table(Table(data))
+        styled = engine._render_html_table(Table(data, column_style={'f': None}))
+
+        def cells(html):
+            return re.findall(r'<td[^>]*>(.*?)</td>', html)
+
+        self.assertEqual(cells(plain), ['1.500000', '<b>x</b>', '1', 'nan', 'nan', '2'])
+        self.assertEqual(cells(plain), cells(styled))
+
+    def test_unhashable_cell_styles(self):
+        """
+        Test that per-cell styles with unhashable values are converted
+        """
+        engine = HtmlEngine()
+        series = pandas.Series([1, 2])
+        style = TextStyle(color=['red'])
+        css = engine._apply_style(series, [style, TextStyle(weight='bold')])
+        self.assertEqual(list(css), [engine._text_style_to_css(style), engine._text_style_to_css(TextStyle(weight='bold'))])
+
+    def test_star_import(self):
+        """
+        Test that star-import provides the lazily imported HTML engine names
+        """
+        namespace = {}
+        exec('from reports import *', namespace)
+        self.assertIs(namespace['save_report'], save_report)
+        self.assertIs(namespace['Report'], Report)
+
+    def test_add(self):
+        """
+        Test appending content to boxes, grids and sections between renders
+        """
+        def table(name):
+            return Table(pandas.DataFrame([(1, 2)], columns=[name, 'B']), interactive=False)
+
+        box, grid, section = Box(table('first')), Grid(columns=2), Section("Section")
+        report = Report("Report", box, grid, section)
+        engine = HtmlEngine()
+        self.assertNotIn('second', engine.render(report))
+
+        box.add(table('second'))
+        grid.add(table('third'), table('fourth'))
+        inner = Section("Inner", table('fifth'))
+        section.add(inner)
+        self.assertEqual(len(box.content), 2)
+        self.assertEqual(len(grid.content), 2)
+        self.assertIs(section.content[-1], inner)
+
+        html = engine.render(report)
+        for name in ('first', 'second', 'third', 'fourth', 'fifth', 'Inner'):
+            self.assertIn(name, html)
+        self.assertEqual(inner.level, 2)
+
+    def test_chart_reuse(self):
+        """
+        Test that repeated and identical charts share a single figure within a render
+        """
+        series = DataSeries(x=[1, 2, 3], y=[10, 20, 30], title="line")
+        chart = LineChart("Chart", series)
+        engine = HtmlEngine()
+        built = []
+        render_line_chart = engine._render_line_chart
+        engine._render_line_chart = lambda obj, **kwargs: built.append(obj) or render_line_chart(obj, **kwargs)
+
+        html = engine.render(Report("Report", chart, chart, LineChart("Chart", series)))
+        self.assertEqual(len(built), 1)
+        self.assertEqual(html.count('data-root-id'), 3)
+
+        built.clear()
+        engine.render(Report("Report", chart, LineChart("Chart", DataSeries(x=[1, 2, 3], y=[10, 20, 30]))))
+        self.assertEqual(len(built), 2)
+
+    def test_concurrent_renders(self):
+        """
+        Test that renders sharing an engine in several threads keep separate caches
+        """
+        first = LineChart("First", DataSeries(x=[1, 2, 3], y=[10, 20, 30]))
+        second = LineChart("Second", DataSeries(x=[1, 2, 3], y=[30, 20, 10]))
+        engine = HtmlEngine()
+        built = []
+        render_line_chart = engine._render_line_chart
+
+        def build(obj, **kwargs):
+            built.append(obj)
+            if obj is second:
+                # another thread renders the first chart while this render is in progress
+                with ThreadPoolExecutor(1) as pool:
+                    pool.submit(engine.render, Report("Other", first)).result()
+            return render_line_chart(obj, **kwargs)
+
+        engine._render_line_chart = build
+        html = engine.render(Report("Report", first, second, second))
+        self.assertEqual(built, [first, second, first])
+        self.assertEqual(html.count('data-root-id'), 3)
+
+    def test_boxes(self):
+        """
+        Test vertical / horizontal boxes
+        """
+        table = Table(pandas.DataFrame([(1, 2)], columns=['A', 'B']), interactive=False)
+        vbox, hbox = VBox(table, table), HBox(table)
+        self.assertEqual((vbox.orientation, hbox.orientation), ('vertical', 'horizontal'))
+
+        html = HtmlEngine().render(Report("Report", vbox, hbox))
+        self.assertIn('reports-vbox', html)
+        self.assertIn('reports-hbox', html)
+
+    def test_combo_chart(self):
+        """
+        Test combo charts with only bars or only lines
+        """
+        bars = ComboChart("Bars", bars=[DataSeries(x=['a', 'b'], y=[1, 2], title="bars")])
+        lines = ComboChart("Lines", lines=[DataSeries(x=['a', 'c'], y=[3, 4], title="line")])
+        self.assertEqual((bars.lines, lines.bars), ([], []))
+
+        engine = HtmlEngine()
+        self.assertEqual(engine._render_combo_chart(lines).x_range.factors, ['a', 'c'])
+        engine.render(Report("Report", bars, lines))
+
+    def test_x_factors(self):
+        """
+        Test categorical X axis values of line charts
+        """
+        sortable = LineChart("Chart", DataSeries(x=['b', 'a'], y=[1, 2]), DataSeries(x=['c', 'a'], y=[3, 4]))
+        self.assertEqual(HtmlEngine._x_factors(sortable), ['a', 'b', 'c'])
+        # values that cannot be sorted keep the order of appearance
+        mixed = LineChart("Chart", DataSeries(x=['b', None, 'a', 'b'], y=[1, 2, 3, 4]))
+        self.assertEqual(HtmlEngine._x_factors(mixed), ['b', None, 'a'])
+        self.assertIsNone(HtmlEngine._x_factors(LineChart("Chart", DataSeries(x=[1, 2], y=[1, 2]))))
+
+    def test_bar_chart(self):
+        """
+        Test that bar series are dodged around the category center
+        """
+        chart = BarChart("Bars", *(DataSeries(x=['a', 'b'], y=[i, i + 1], title=str(i)) for i in range(3)))
+        fig = HtmlEngine()._render_bar_chart(chart)
+        bars = [r for r in fig.renderers if isinstance(r.glyph, bokeh.models.VBar)]
+        width = 0.8 / 3
+        for bar, offset in zip(bars, (-width, 0, width)):
+            self.assertAlmostEqual(bar.glyph.x.transform.value, offset)
+            self.assertAlmostEqual(bar.glyph.width, width * 0.9)
+
+    def test_save_report(self):
+        """
+        Test saving plain and compressed reports
+        """
+        report = Report("Saved Report", Table(pandas.DataFrame([(1, 2)], columns=['A', 'B']), interactive=False))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'report.html')
+            save_report(report, path)
+            with open(path, encoding='utf-8') as f:
+                html = f.read()
+
+            save_report(report, path + '.gz', compress=True)
+            with gzip.open(path + '.gz', 'rt', encoding='utf-8') as f:
+                self.assertEqual(f.read(), html)
+
+        self.assertIn('Saved Report', html)